@@ -1,39 +1,43 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import logging
+import os
 import random
 import time
 from typing import List
 import sys
 
 import numpy as np
-from numpy.core.fromnumeric import mean
-
 import simpy
-from simpy.core import T
-
-import numpy
 
-from models import Buffer, Component, Inspector, Workstation, workstation
+from models import Buffer, Component, Inspector, Workstation, run_sim_fast
 import runanalysis
 
 # Control constants
 
 BUFFER_SIZE = 2
 
+# Data files used to calculate the mean for each component and workstation
+MEAN_DATA_FILES = {
+  Component.C1.name: './data/servinsp1.dat',
+  Component.C2.name: './data/servinsp22.dat',
+  Component.C3.name: './data/servinsp1.dat',
+  'ws1': './data/ws1.dat',
+  'ws2': './data/ws2.dat',
+  'ws3': './data/ws3.dat',
+}
+
+MEANS_CACHE = './data/.means_cache.npz'
+
 # Control constants (will be set later by argument parser)
 # SEED = 12345
 # SIM_TIME = 43800 # 8 hour shift?
 # ITERATIONS = 200
 
-w1_wait_time = []
-w2_wait_time = []
-w3_wait_time = []
-
-w1_processing_time = []
-w2_processing_time = []
-w3_processing_time = []
-
-workstation_finishing_times = {}
+# Means and models used by worker processes (will be set by the pool initializer)
+worker_means = None
+worker_models = None
 
 
 def parse_arguments():
@@ -43,9 +47,10 @@ def parse_arguments():
   parser.add_argument('-d', '--duration', type=int, default=480)
   parser.add_argument('-s', '--seed', type=int, default=12345)
   parser.add_argument('-w', '--wait', type=int, default=1000)
+  parser.add_argument('-f', '--fast', action='store_true', help='run the compiled simulation instead of SimPy')
 
   # Create global control constants
-  global ITERATIONS, SIM_TIME, SEED, START_RECORDING
+  global ITERATIONS, SIM_TIME, SEED, START_RECORDING, FAST
 
   # Set globals with command line arguments
   args = parser.parse_args()
@@ -53,6 +58,7 @@ def parse_arguments():
   SIM_TIME = args.duration
   SEED = args.seed
   START_RECORDING = args.wait
+  FAST = args.fast
 
 
 def init_logging() -> None:
@@ -63,29 +69,57 @@ def init_logging() -> None:
 
 def init_means() -> dict:
   '''Get a dictionary of all the means from the data for each file'''
-  means = dict()
+  # Return a copy so callers can't modify the memoized means
+  return dict(read_means())
 
-  data = np.fromfile('./data/servinsp1.dat', dtype=np.float64, sep="\n")
-  means[Component.C1.name] = np.mean(data)
 
-  data = np.fromfile('./data/servinsp22.dat', dtype=np.float64, sep="\n")
-  means[Component.C2.name] = np.mean(data)
+@functools.lru_cache(maxsize=1)
+def read_means() -> dict:
+  '''Load the means from the cache file, or compute them from the data files and save them to the cache'''
+  data_files = set(MEAN_DATA_FILES.values())
+  sources = get_means_sources()
 
-  data = np.fromfile('./data/servinsp1.dat', dtype=np.float64, sep="\n")
-  means[Component.C3.name] = np.mean(data)
+  # Only use the cache if every mean came from the same data file, with the same size and modification time
+  if os.path.exists(MEANS_CACHE):
+    with np.load(MEANS_CACHE) as cache:
+      if 'sources' in cache.files and sorted(cache['sources'].tolist()) == sorted(sources):
+        return {key: float(cache[key]) for key in MEAN_DATA_FILES}
 
-  data = np.fromfile('./data/ws1.dat', dtype=np.float64, sep="\n")
-  means['ws1'] = np.mean(data)
+  # Read each data file once, even if it is used for more than one mean
+  file_means = {path: read_file_mean(path) for path in data_files}
+  means = {key: file_means[path] for key, path in MEAN_DATA_FILES.items()}
 
-  data = np.fromfile('./data/ws2.dat', dtype=np.float64, sep="\n")
-  means['ws2'] = np.mean(data)
-
-  data = np.fromfile('./data/ws3.dat', dtype=np.float64, sep="\n")
-  means['ws3'] = np.mean(data)
+  try:
+    np.savez(MEANS_CACHE, sources=np.array(sources), **means)
+  except OSError:
+    logging.debug('unable to write means cache to {}'.format(MEANS_CACHE))
 
   return means
 
 
+def get_means_sources() -> List[str]:
+  '''Describe where each mean comes from, as the key, data file path, file size and modification time'''
+  sources = []
+  for key, path in MEAN_DATA_FILES.items():
+    stat = os.stat(path)
+    sources.append('{}|{}|{}|{}'.format(key, path, stat.st_size, stat.st_mtime_ns))
+  return sources
+
+
+def read_file_mean(path: str) -> float:
+  '''Calculate the mean of a data file with one value per line in a single pass, without loading the whole file'''
+  total = 0.0
+  count = 0
+  with open(path) as file:
+    for line in file:
+      if line.strip():
+        total += float(line)
+        count += 1
+  if count == 0:
+    raise ValueError('data file {} has no values to calculate a mean from'.format(path))
+  return total / count
+
+
 def print_progress_bar (iteration: int, total: int, prefix: str='', suffix: str='', decimals: int= 1, length: int=100, fill: str='█', printEnd: str="\r"):
   """
   Call in a loop to create terminal progress bar
@@ -107,9 +141,40 @@ def print_progress_bar (iteration: int, total: int, prefix: str='', suffix: str=
   if iteration == total: 
       print()
 
-def run_iteration(seed: int, means: dict, iteration:int):
+def init_worker(means: dict, sim_time: int, start_recording: int, fast: bool) -> None:
   '''
-  Run a single iteration for the simulation. Creates a new environment each time
+  Initialize a worker process so the means and control constants are only sent once per process,
+  and the models are only built once per process
+  ...
+  Parameters
+  ----------
+  means: dict
+    The means to use for the random expovariate functions
+  sim_time: int
+    Amount of minutes in each simulation run
+  start_recording: int
+    Time at which the models start recording statistics
+  fast: bool
+    Whether to run the compiled simulation instead of SimPy
+  '''
+  global worker_means, worker_models, SIM_TIME, START_RECORDING, FAST
+  worker_means = means
+  SIM_TIME = sim_time
+  START_RECORDING = start_recording
+  FAST = fast
+
+  # Build the models once per worker process, each iteration resets them
+  worker_models = None if fast else build_models(means)
+
+
+def run_iteration_worker(seed: int) -> tuple:
+  '''Run a single iteration in a worker process using the means and models set by init_worker'''
+  return run_iteration(seed=seed, means=worker_means, models=worker_models)
+
+
+def run_iteration(seed: int, means: dict, models: tuple) -> tuple:
+  '''
+  Run a single iteration for the simulation and get the data recorded by the models
   ...
   Parameters
   ----------
@@ -117,12 +182,36 @@ def run_iteration(seed: int, means: dict, iteration:int):
     The seed to be used for the random generation
   means: dict
     The means to use for the random expovariate functions
+  models: tuple
+    The buffers, workstations and inspectors from build_models, reused by the SimPy simulation
+
+  Returns
+  ----------
+  tuple:
+    The workstation data and inspector data for this iteration, as plain arrays
   '''
+  if FAST:
+    return run_simulation_fast(seed=seed, means=means)
 
-  # Set up random generation
-  random.seed(seed)
+  workstation_list, inspector_list = run_simulation(seed=seed, models=models)
+  return runanalysis.get_workstation_data(workstation_list), runanalysis.get_inspector_data(inspector_list)
 
-  # Set up environment
+
+def build_models(means: dict) -> tuple:
+  '''
+  Build the buffers, workstations and inspectors, so they can be reset and reused for each iteration
+  ...
+  Parameters
+  ----------
+  means: dict
+    The means to use for the random expovariate functions
+
+  Returns
+  ----------
+  tuple:
+    The list of buffers, the list of workstations and the list of inspectors
+  '''
+  # Set up environment, each iteration resets the models with a new one
   main_env = simpy.Environment()
   
   # Set up components
@@ -137,10 +226,12 @@ def run_iteration(seed: int, means: dict, iteration:int):
   b3c1 = Buffer(id='w3c1', env=main_env, accepts=Component.C1, capacity=BUFFER_SIZE, init=0)
   b3c3 = Buffer(id='w3c3', env=main_env, accepts=Component.C3, capacity=BUFFER_SIZE, init=0)
 
+  buffer_list: List[Buffer] = [b1c1, b2c1, b2c2, b3c1, b3c3]
+
   # Init workstations
-  w1 = Workstation(id=1, env=main_env, buffers=[b1c1], mean=means['ws1'], start_recording=START_RECORDING)
-  w2 = Workstation(id=2, env=main_env, buffers=[b2c1, b2c2], mean=means['ws2'], start_recording=START_RECORDING)
-  w3 = Workstation(id=3, env=main_env, buffers=[b3c1, b3c3], mean=means['ws3'], start_recording=START_RECORDING)
+  w1 = Workstation(id=1, env=main_env, buffers=[b1c1], mean=means['ws1'], start_recording=START_RECORDING, sim_duration=SIM_TIME)
+  w2 = Workstation(id=2, env=main_env, buffers=[b2c1, b2c2], mean=means['ws2'], start_recording=START_RECORDING, sim_duration=SIM_TIME)
+  w3 = Workstation(id=3, env=main_env, buffers=[b3c1, b3c3], mean=means['ws3'], start_recording=START_RECORDING, sim_duration=SIM_TIME)
 
   workstation_list: List[Workstation] = [w1, w2, w3]
 
@@ -151,7 +242,8 @@ def run_iteration(seed: int, means: dict, iteration:int):
     components=[Component.C1], 
     buffers=[b1c1, b2c1, b3c1], 
     means={ key: means[key] for key in [Component.C1.name] },
-    start_recording=START_RECORDING
+    start_recording=START_RECORDING,
+    sim_duration=SIM_TIME
   )
   
   inspector_two = Inspector(
@@ -160,11 +252,49 @@ def run_iteration(seed: int, means: dict, iteration:int):
     components=[Component.C2, Component.C3], 
     buffers=[b2c2, b3c3], 
     means={ key: means[key] for key in [Component.C2.name, Component.C3.name] },
-    start_recording=START_RECORDING
+    start_recording=START_RECORDING,
+    sim_duration=SIM_TIME
   )
 
   inspector_list: List[Inspector] = [inspector_one, inspector_two]
 
+  return buffer_list, workstation_list, inspector_list
+
+
+def run_simulation(seed: int, models: tuple) -> tuple:
+  '''
+  Run a single iteration of the SimPy simulation. Creates a new environment each time
+  ...
+  Parameters
+  ----------
+  seed: int
+    The seed to be used for the random generation
+  models: tuple
+    The buffers, workstations and inspectors from build_models
+
+  Returns
+  ----------
+  tuple:
+    The list of workstations and the list of inspectors after the run
+  '''
+
+  # Set up random generation
+  rng = np.random.default_rng(seed)
+
+  # Set up environment
+  main_env = simpy.Environment()
+
+  # Reset the models for the new environment
+  buffer_list, workstation_list, inspector_list = models
+  for buffer in buffer_list:
+    buffer.reset(main_env)
+
+  for workstation in workstation_list:
+    workstation.reset(main_env, rng)
+
+  for inspector in inspector_list:
+    inspector.reset(main_env, rng)
+
 
   # Set up workstation processes
   for workstation in workstation_list:
@@ -178,40 +308,56 @@ def run_iteration(seed: int, means: dict, iteration:int):
   # Run simulation
   main_env.run(until=SIM_TIME)
 
-  # Record values
-  w1_wait_time.append(w1.wait_time)
-  w2_wait_time.append(w2.wait_time)
-  w3_wait_time.append(w3.wait_time)
+  return workstation_list, inspector_list
 
-  w1_processing_time.append(w1.processing_time)
-  w2_processing_time.append(w2.processing_time)
-  w3_processing_time.append(w3.processing_time)
 
-  # print('w1 wait time: {}'.format(w1_wait_time))
-  # print('w2 wait time: {}'.format(w2_wait_time))
-  # print('w3 wait time: {}'.format(w3_wait_time))
-
-  workstation_finishing_times[w1.id] = w1.component_finish_times
-  workstation_finishing_times[w2.id] = w2.component_finish_times
-  workstation_finishing_times[w3.id] = w3.component_finish_times
+def run_simulation_fast(seed: int, means: dict) -> tuple:
+  '''
+  Run a single iteration of the compiled simulation, and arrange its results like the data recorded by the models
+  ...
+  Parameters
+  ----------
+  seed: int
+    The seed to be used for the random generation
+  means: dict
+    The means to use for the random expovariate functions
 
+  Returns
+  ----------
+  tuple:
+    The runanalysis.WorkstationData and runanalysis.InspectorData for this iteration
+  '''
+  (ws_count, ws_start, ws_processing, ws_wait, ws_n,
+   insp_count, insp_times, insp_times_n, insp_wait, insp_wait_n) = run_sim_fast(
+    SIM_TIME, BUFFER_SIZE,
+    means[Component.C1.name], means[Component.C2.name], means[Component.C3.name],
+    means['ws1'], means['ws2'], means['ws3'],
+    START_RECORDING, seed
+  )
 
-  # Calculate stats for workstation for this iteration
-  workstation_stats[iteration] = runanalysis.calc_stats_workstation(
-    workstation_list=workstation_list,
-    iteration=iteration,
-    sim_duration=SIM_TIME,
-    start_recording=START_RECORDING
+  # Build the plain arrays directly instead of filling in model objects that are thrown away
+  workstation_data = runanalysis.WorkstationData(
+    ids=np.array([1, 2, 3]),
+    amounts_assembled=ws_count,
+    starts=ws_start,
+    processing_times=[ws_processing[index, :ws_n[index]] for index in range(3)],
+    wait_times=[ws_wait[index, :ws_n[index]] for index in range(3)]
   )
 
-  # Calculate stats for inspector for this iteration
-  inspector_stats[iteration] = runanalysis.calc_stats_inspector(
-    inspector_list=inspector_list,
-    iteration=iteration,
-    sim_duration=SIM_TIME,
-    start_recording=START_RECORDING
+  inspector_components = [[Component.C1], [Component.C2, Component.C3]]
+  rows = [component.value - 1 for components in inspector_components for component in components]
+  inspector_data = runanalysis.InspectorData(
+    ids=np.array([1, 2]),
+    # The compiled simulation doesn't track when the buffer waits started
+    starts=np.zeros(2, dtype=np.float64),
+    num_components=np.array([len(components) for components in inspector_components]),
+    wait_times=[insp_wait[index, :insp_wait_n[index]] for index in range(2)],
+    component_ids=np.array([row + 1 for row in rows]),
+    amounts_inspected=insp_count[rows],
+    inspection_times=[insp_times[row, :insp_times_n[row]] for row in rows]
   )
 
+  return workstation_data, inspector_data
 
 
 if __name__ == '__main__':
@@ -230,16 +376,41 @@ if __name__ == '__main__':
   # Create a list of seeds to use
   seed_list = [random.getrandbits(32) for iteration in range(ITERATIONS)]
 
-  # Create empty numpy arrays for storing statistics from each simulation iteration
-  workstation_stats = np.empty(shape=(ITERATIONS, ), dtype=object)
-  inspector_stats = np.empty(shape=(ITERATIONS, ), dtype=object)
+  # Create empty lists for storing the data from each simulation iteration
+  workstation_data = [None] * ITERATIONS
+  inspector_data = [None] * ITERATIONS
 
   start_time = time.time()
   logging.info('Running the simulation with seed={seed}, iterations={iters} duration={duration}, wait={wait}'.format(seed=SEED, iters=ITERATIONS, duration=SIM_TIME, wait=START_RECORDING))
 
-  for index, seed in enumerate(seed_list):
-    run_iteration(seed=seed, means=means, iteration=index)
-    print_progress_bar(iteration=index, total=ITERATIONS, prefix='Progress:', length=50)
+  # Run the independent iterations in parallel, sending the means once per worker process
+  num_workers = os.cpu_count() or 1
+  with ProcessPoolExecutor(
+    max_workers=num_workers,
+    initializer=init_worker,
+    initargs=(means, SIM_TIME, START_RECORDING, FAST)
+  ) as executor:
+    results = executor.map(
+      run_iteration_worker,
+      seed_list,
+      chunksize=max(1, ITERATIONS // (4 * num_workers))
+    )
+    for index, (ws_data, insp_data) in enumerate(results):
+      workstation_data[index] = ws_data
+      inspector_data[index] = insp_data
+      print_progress_bar(iteration=index, total=ITERATIONS, prefix='Progress:', length=50)
+
+  # Calculate stats for all iterations at once
+  workstation_stats = runanalysis.calc_stats_workstation_batch(
+    run_data=workstation_data,
+    sim_duration=SIM_TIME,
+    start_recording=START_RECORDING
+  )
+  inspector_stats = runanalysis.calc_stats_inspector_batch(
+    run_data=inspector_data,
+    sim_duration=SIM_TIME,
+    start_recording=START_RECORDING
+  )
 
   # Calculate stats for whole run
   ws_df = runanalysis.create_df_workstations(run_data=workstation_stats)
@@ -252,10 +423,14 @@ if __name__ == '__main__':
 
   # print(insp_df.query("component_id=='C2'"))
 
+  # Average the measurements of each workstation and each component in a single groupby each
+  ws_means = ws_df.groupby('workstation_id')[['processing_time_mean', 'throughput']].mean()
+  insp_means = insp_df.groupby('component_id')['component_throughput'].mean()
+
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Processing Time',
     source='Workstation 1',
-    quantity=ws_df.query('workstation_id==1')['processing_time_mean'].mean(skipna=True)
+    quantity=ws_means.loc[1, 'processing_time_mean']
   ))
 
 
@@ -264,49 +439,49 @@ if __name__ == '__main__':
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Processing Time',
     source='Workstation 2',
-    quantity=ws_df.query('workstation_id==2')['processing_time_mean'].mean(skipna=True)
+    quantity=ws_means.loc[2, 'processing_time_mean']
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Processing Time',
     source='Workstation 3',
-    quantity=ws_df.query('workstation_id==3')['processing_time_mean'].mean(skipna=True)
+    quantity=ws_means.loc[3, 'processing_time_mean']
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput',
     source='Inspector 1, component 1',
-    quantity=insp_df.query("component_id==1")['component_throughput'].mean(skipna=True)
+    quantity=insp_means.loc[1]
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput',
     source='Inspector 2, component 2',
-    quantity=insp_df.query("component_id==2")['component_throughput'].mean(skipna=True)
+    quantity=insp_means.loc[2]
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput',
     source='Inspector 2, component 3',
-    quantity=insp_df.query("component_id==3")['component_throughput'].mean(skipna=True)
+    quantity=insp_means.loc[3]
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput per hour',
     source='Workstation 1',
-    quantity=(ws_df.query("workstation_id==1")['throughput'].mean(skipna=True) / (SIM_TIME / 60))
+    quantity=(ws_means.loc[1, 'throughput'] / (SIM_TIME / 60))
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput per hour',
     source='Workstation 2',
-    quantity=(ws_df.query("workstation_id==2")['throughput'].mean(skipna=True) / (SIM_TIME / 60))
+    quantity=(ws_means.loc[2, 'throughput'] / (SIM_TIME / 60))
   ))
 
   logging.info('{measurement} for {source}: {quantity}'.format(
     measurement='Average Throughput per hour',
     source='Workstation 3',
-    quantity=(ws_df.query("workstation_id==3")['throughput'].mean(skipna=True) / (SIM_TIME / 60))
+    quantity=(ws_means.loc[3, 'throughput'] / (SIM_TIME / 60))
   ))
 
   # print('Average processing time:{}'.format(numpy.mean(np.hstack(w1_processing_time).mean())))
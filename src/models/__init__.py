@@ -4,3 +4,4 @@ from .buffer import Buffer
 from .component import Component
 from .inspector import Inspector
 from .workstation import Workstation
+from .fast_sim import run_sim_fast
@@ -1,5 +1,4 @@
-import random
-from typing import Union
+from typing import Optional, Union
 
 import simpy
 from simpy import Container, Environment
@@ -12,14 +11,59 @@ class Buffer(Container):
     super().__init__(env=env, capacity=capacity, init=init)
     self.id = id
     self.accepts = accepts
+    # Triggered (and replaced) when a component is taken out of the buffer while it is full
+    self.not_full_event = env.event()
+    # Triggered (and replaced) when a component is put in the buffer while it is empty
+    self.not_empty_event = env.event()
   
   
+  def reset(self, env: Environment) -> None:
+    '''Empty the buffer so it can be reused in a new environment'''
+    Container.__init__(self, env=env, capacity=self.capacity, init=0)
+    self.not_full_event = env.event()
+    self.not_empty_event = env.event()
+
+
+  def take(self, amount: Union[int, float]=1) -> None:
+    '''
+    Take components out of the buffer right away, without creating a get request
+    The buffer must hold at least amount components
+    '''
+    was_full = self._level >= self._capacity
+    self._level -= amount
+    if was_full:
+      self.not_full_event.succeed()
+      self.not_full_event = self._env.event()
+    # Let any waiting put requests into the space that was freed
+    self._trigger_put(None)
+
+
+  def _do_put(self, event: simpy.resources.container.ContainerPut) -> Optional[bool]:
+    '''Put components in the buffer, waking up anything waiting for it to stop being empty'''
+    was_empty = self._level == 0
+    if super()._do_put(event):
+      if was_empty:
+        self.not_empty_event.succeed()
+        self.not_empty_event = self._env.event()
+      return True
+    return None
+
+
+  def _do_get(self, event: simpy.resources.container.ContainerGet) -> Optional[bool]:
+    '''Take components out of the buffer, waking up anything waiting for it to stop being full'''
+    was_full = self._level >= self._capacity
+    if super()._do_get(event):
+      if was_full:
+        self.not_full_event.succeed()
+        self.not_full_event = self._env.event()
+      return True
+    return None
+
+
   def will_accept(self, component: Component) -> bool:
     '''Test if this buffer will accept a certain component type'''
-    if component == self.accepts:
-      return True
-    else:
-      return False
+    # Enum members are singletons, so an identity check is enough
+    return component is self.accepts
   
 
 
@@ -1,6 +1,6 @@
-from enum import Enum
+from enum import IntEnum
 
-class Component(Enum):
+class Component(IntEnum):
   C1 = 1
   C2 = 2
   C3 = 3
\ No newline at end of file
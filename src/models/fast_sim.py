@@ -0,0 +1,284 @@
+from typing import Tuple
+
+import numpy as np
+from numba import njit
+
+# Buffer indices in the levels array
+B1C1, B2C1, B2C2, B3C1, B3C3 = 0, 1, 2, 3, 4
+NUM_BUFFERS = 5
+
+# Actor indices in the next event time array
+INSPECTOR_1, INSPECTOR_2 = 0, 1
+NUM_INSPECTORS = 2
+NUM_WORKSTATIONS = 3
+NUM_ACTORS = NUM_INSPECTORS + NUM_WORKSTATIONS
+
+# Starting number of columns for the recorded statistics, grows as needed
+INITIAL_CAPACITY = 64
+
+# Extra random samples generated for each stream on top of the expected number of events
+SAMPLE_MARGIN = 64
+
+
+@njit(cache=True)
+def _append(data: np.ndarray, counts: np.ndarray, row: int, value: float) -> np.ndarray:
+  '''Append a value to a row of a 2d array, doubling the number of columns if the row is full'''
+  n = counts[row]
+  if n == data.shape[1]:
+    grown = np.empty((data.shape[0], data.shape[1] * 2), dtype=np.float64)
+    grown[:, :n] = data
+    data = grown
+  data[row, n] = value
+  counts[row] = n + 1
+  return data
+
+
+@njit(cache=True)
+def pick_target(levels: np.ndarray, buffer_size: int, buffers: np.ndarray) -> int:
+  '''
+  Find the least full buffer, favoring the first buffer in case of a tie
+  ...
+  Parameters
+  ----------
+  levels: np.ndarray
+    Current level of every buffer
+  buffer_size: int
+    Capacity of each buffer
+  buffers: np.ndarray
+    Indices of the buffers to choose from, sorted by priority (highest first)
+
+  Returns
+  ----------
+  int:
+    Index of the chosen buffer, or -1 if all of the buffers are full
+  '''
+  target = -1
+  for buffer in buffers:
+    if levels[buffer] < buffer_size and (target == -1 or levels[buffer] < levels[target]):
+      target = buffer
+  return target
+
+
+def run_sim_fast(sim_time: float, buffer_size: int, mean_c1: float, mean_c2: float, mean_c3: float,
+                 mean_w1: float, mean_w2: float, mean_w3: float, start_recording: float, seed: int) -> Tuple:
+  '''
+  Run a single iteration of the simulation without SimPy.
+  ...
+  Parameters
+  ----------
+  sim_time: float
+    Amount of minutes in the simulation run
+  buffer_size: int
+    Capacity of each buffer
+  mean_c1, mean_c2, mean_c3: float
+    The mean inspection time for each component
+  mean_w1, mean_w2, mean_w3: float
+    The mean assembly time for each workstation
+  start_recording: float
+    Time at which statistics start being recorded
+  seed: int
+    The seed to be used for the random generation
+
+  Returns
+  ----------
+  tuple:
+    Workstation counts, start times, processing times, wait times and row lengths,
+    followed by inspector counts per component, inspection times per component and
+    row lengths, wait times per inspector and row lengths
+  '''
+  component_means = np.array([mean_c1, mean_c2, mean_c3])
+  workstation_means = np.array([mean_w1, mean_w2, mean_w3])
+
+  # Each random stream has its own generator, so the start of a stream stays the same
+  # when more samples are generated for it
+  inspection_seeds, assembly_seeds, choice_seed = np.split(np.random.SeedSequence(seed).spawn(7), [3, 6])
+  size = int(sim_time / min(component_means.min(), workstation_means.min())) + SAMPLE_MARGIN
+  while True:
+    inspection_times = np.stack([
+      np.random.default_rng(stream_seed).exponential(scale=mean, size=size)
+      for stream_seed, mean in zip(inspection_seeds, component_means)
+    ])
+    assembly_times = np.stack([
+      np.random.default_rng(stream_seed).exponential(scale=mean, size=size)
+      for stream_seed, mean in zip(assembly_seeds, workstation_means)
+    ])
+    component_choices = np.random.default_rng(choice_seed[0]).integers(1, 3, size=size)
+
+    result = _run_sim(sim_time, buffer_size, start_recording, inspection_times, assembly_times, component_choices)
+    if not result[0]:
+      return result[1:]
+
+    # Ran out of random samples, run again with more
+    size *= 2
+
+
+@njit(cache=True)
+def _run_sim(sim_time: float, buffer_size: int, start_recording: float,
+             inspection_times: np.ndarray, assembly_times: np.ndarray, component_choices: np.ndarray) -> Tuple:
+  '''
+  Compiled event loop for run_sim_fast, using pre-generated random samples
+  ...
+  Parameters
+  ----------
+  sim_time: float
+    Amount of minutes in the simulation run
+  buffer_size: int
+    Capacity of each buffer
+  start_recording: float
+    Time at which statistics start being recorded
+  inspection_times: np.ndarray
+    Inspection times for each component, one row per component
+  assembly_times: np.ndarray
+    Assembly times for each workstation, one row per workstation
+  component_choices: np.ndarray
+    Components chosen by inspector 2, either 1 (C2) or 2 (C3)
+
+  Returns
+  ----------
+  tuple:
+    Whether the random samples ran out before the end of the run, followed by the
+    results described in run_sim_fast
+  '''
+  # Index of the next random sample to use from each stream
+  inspection_index = np.zeros(3, dtype=np.int64)
+  assembly_index = np.zeros(NUM_WORKSTATIONS, dtype=np.int64)
+  choice_index = 0
+  num_samples = component_choices.shape[0]
+
+  # Buffers used by each workstation, -1 if unused
+  workstation_buffers = np.array([[B1C1, -1], [B2C1, B2C2], [B3C1, B3C3]])
+  # Buffers used by inspector 1 in order of priority
+  inspector_1_buffers = np.array([B1C1, B2C1, B3C1])
+
+  levels = np.zeros(NUM_BUFFERS, dtype=np.int8)
+  next_time = np.full(NUM_ACTORS, np.inf)
+
+  # Inspector state
+  inspector_component = np.zeros(NUM_INSPECTORS, dtype=np.int64)
+  inspector_inspection_time = np.zeros(NUM_INSPECTORS)
+  inspector_blocked = np.zeros(NUM_INSPECTORS, dtype=np.bool_)
+  inspector_block_start = np.zeros(NUM_INSPECTORS)
+
+  # Workstation state
+  workstation_held = np.zeros((NUM_WORKSTATIONS, 2), dtype=np.bool_)
+  workstation_waiting = np.ones(NUM_WORKSTATIONS, dtype=np.bool_)
+  workstation_wait_start = np.zeros(NUM_WORKSTATIONS)
+  workstation_start = np.zeros(NUM_WORKSTATIONS)
+
+  # Recorded statistics
+  ws_count = np.zeros(NUM_WORKSTATIONS, dtype=np.int64)
+  ws_processing = np.empty((NUM_WORKSTATIONS, INITIAL_CAPACITY))
+  ws_processing_n = np.zeros(NUM_WORKSTATIONS, dtype=np.int64)
+  ws_wait = np.empty((NUM_WORKSTATIONS, INITIAL_CAPACITY))
+  ws_wait_n = np.zeros(NUM_WORKSTATIONS, dtype=np.int64)
+  insp_count = np.zeros(3, dtype=np.int64)
+  insp_times = np.empty((3, INITIAL_CAPACITY))
+  insp_times_n = np.zeros(3, dtype=np.int64)
+  insp_wait = np.empty((NUM_INSPECTORS, INITIAL_CAPACITY))
+  insp_wait_n = np.zeros(NUM_INSPECTORS, dtype=np.int64)
+
+  # Inspector 1 only inspects C1, inspector 2 randomly inspects C2 or C3
+  now = 0.0
+  for inspector in range(NUM_INSPECTORS):
+    if inspector == INSPECTOR_1:
+      component = 0
+    else:
+      component = component_choices[choice_index]
+      choice_index += 1
+    inspector_component[inspector] = component
+    inspector_inspection_time[inspector] = inspection_times[component, inspection_index[component]]
+    inspection_index[component] += 1
+    next_time[inspector] = now + inspector_inspection_time[inspector]
+
+  exhausted = False
+  while True:
+    # Each event uses at most one sample from each stream
+    if max(inspection_index.max(), assembly_index.max(), choice_index) >= num_samples - 1:
+      exhausted = True
+      break
+
+    actor = np.argmin(next_time)
+    if next_time[actor] >= sim_time:
+      break
+    now = next_time[actor]
+    next_time[actor] = np.inf
+
+    if actor < NUM_INSPECTORS:
+      # Inspection finished, the inspector is blocked until the component is placed in a buffer
+      inspector_blocked[actor] = True
+      inspector_block_start[actor] = now
+    else:
+      # Assembly finished, record the product and start waiting for components
+      workstation = actor - NUM_INSPECTORS
+      if now >= start_recording:
+        ws_count[workstation] += 1
+        ws_processing = _append(ws_processing, ws_processing_n, workstation, now - workstation_start[workstation])
+        ws_wait = _append(ws_wait, ws_wait_n, workstation, workstation_start[workstation] - workstation_wait_start[workstation])
+      workstation_waiting[workstation] = True
+      workstation_wait_start[workstation] = now
+
+    # Move components between inspectors, buffers and workstations until nothing else can move
+    changed = True
+    while changed:
+      changed = False
+
+      for inspector in range(NUM_INSPECTORS):
+        if not inspector_blocked[inspector]:
+          continue
+        component = inspector_component[inspector]
+
+        # Find the target buffer, or -1 if the inspector is still blocked
+        target = -1
+        if inspector == INSPECTOR_1:
+          target = pick_target(levels, buffer_size, inspector_1_buffers)
+        else:
+          buffer = B2C2 if component == 1 else B3C3
+          if levels[buffer] < buffer_size:
+            target = buffer
+
+        if target == -1:
+          continue
+
+        levels[target] += 1
+        inspector_blocked[inspector] = False
+        changed = True
+        if now >= start_recording:
+          insp_count[component] += 1
+          insp_wait = _append(insp_wait, insp_wait_n, inspector, now - inspector_block_start[inspector])
+          insp_times = _append(insp_times, insp_times_n, component, inspector_inspection_time[inspector])
+
+        # Start the next inspection
+        if inspector != INSPECTOR_1:
+          component = component_choices[choice_index]
+          choice_index += 1
+        inspector_component[inspector] = component
+        inspector_inspection_time[inspector] = inspection_times[component, inspection_index[component]]
+        inspection_index[component] += 1
+        next_time[inspector] = now + inspector_inspection_time[inspector]
+
+      for workstation in range(NUM_WORKSTATIONS):
+        if not workstation_waiting[workstation]:
+          continue
+
+        # Take a component from each buffer as soon as it is available
+        ready = True
+        for slot in range(2):
+          buffer = workstation_buffers[workstation, slot]
+          if buffer == -1 or workstation_held[workstation, slot]:
+            continue
+          if levels[buffer] > 0:
+            levels[buffer] -= 1
+            workstation_held[workstation, slot] = True
+            changed = True
+          else:
+            ready = False
+
+        if ready:
+          workstation_held[workstation, :] = False
+          workstation_waiting[workstation] = False
+          workstation_start[workstation] = now
+          next_time[NUM_INSPECTORS + workstation] = now + assembly_times[workstation, assembly_index[workstation]]
+          assembly_index[workstation] += 1
+
+  return (exhausted, ws_count, workstation_start, ws_processing, ws_wait, ws_processing_n,
+          insp_count, insp_times, insp_times_n, insp_wait, insp_wait_n)
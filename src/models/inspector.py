@@ -1,21 +1,110 @@
+from inspect import isfunction
 import logging
-import random
-from typing import Generator, List, Union
+from types import MethodType
+from typing import Callable, Generator, List, Optional, Union
 
-import simpy
+import numpy as np
 from simpy import Environment
 
 from .buffer import Buffer
 from .component import Component
 
+# Largest number of inspection times generated at once for each component
+INSPECTION_TIME_BATCH_SIZE = 8192
+
+# Largest number of random component choices generated at once
+COMPONENT_BATCH_SIZE = 8192
+
+# Number of entries initially allocated for the recorded statistics if the simulation duration
+# is unknown, grows as needed
+RECORD_SIZE = 4096
+
+# Extra room allocated on top of the expected number of recorded entries
+RECORD_MARGIN = 1.5
+
+# Extra random values generated on top of the expected number used in a run, so a batch rarely
+# needs refilling. The fixed extra covers short runs, where few values are expected
+BATCH_MARGIN = 1.5
+BATCH_EXTRA = 16
+
+logger = logging.getLogger(__name__)
+
+# Number of entries in the per-component stats lists, which are indexed by the component value
+COMPONENT_SLOTS = max(Component) + 1
+
 class Inspector(object):
-  def __init__(self, id: int,  env: Environment, components: List[Component], buffers: List[Buffer], means: dict, start_recording: Union[int, float]=0) -> None:
+  def __init__(self, id: int,  env: Environment, components: List[Component], buffers: List[Buffer], means: dict, start_recording: Union[int, float]=0, rng: Optional[np.random.Generator]=None, sim_duration: Optional[Union[int, float]]=None, routing_policy: Optional[Callable]=None) -> None:
+    '''
+    Create an inspector that inspects random components and places them in its buffers
+    ...
+    Parameters
+    ----------
+    id: int
+      Id of the inspector
+    env: Environment
+      SimPy environment the inspector runs in
+    components: List[Component]
+      Components the inspector randomly chooses from
+    buffers: List[Buffer]
+      Buffers the inspector can add components to, sorted by priority (highest first)
+    means: dict
+      Mean inspection time of each component, keyed by the component name
+    start_recording: Union[int, float]
+      Time at which statistics start being recorded
+    rng: Optional[np.random.Generator]
+      Random generator for the component choices and inspection times
+    sim_duration: Optional[Union[int, float]]
+      Amount of minutes in the simulation run, used to size the recorded statistics and random batches
+    routing_policy: Optional[Callable]
+      Plain function taking (inspector, component) and yielding the SimPy events that place
+      the component in a buffer, such as Inspector.route_least_full or Inspector.route_by_component.
+      By default route_least_full is used for an inspector that only handles C1, and
+      route_by_component otherwise
+    '''
     super().__init__()
     self.id = id
     self.env = env
     self.buffers = buffers
     self.components = components
     self.means = means
+    self.sim_duration = sim_duration
+    # Mean inspection time indexed by component, nan for components the inspector doesn't handle
+    self._component_means = np.full(COMPONENT_SLOTS, np.nan)
+    for component in components:
+      self._component_means[component] = means[component.name]
+
+    # Routing lookups, the buffer list is sorted by priority (highest first)
+    self._buffer_tuple = tuple(buffers)
+    # Highest priority buffer that will accept each component, or None if no buffer accepts it
+    self._accept_map = {
+      component:next((buffer for buffer in buffers if buffer.will_accept(component)), None)
+      for component in components
+    }
+    # The routing policy is fixed, so choose it once instead of for every component
+    if routing_policy is not None:
+      # Bound methods would be bound a second time here, so only plain functions are accepted
+      if not isfunction(routing_policy):
+        raise TypeError('routing_policy must be a plain function taking (inspector, component), not {!r}'.format(routing_policy))
+      self._route = MethodType(routing_policy, self)
+    else:
+      self._route = self.route_least_full if components == [Component.C1] else self.route_by_component
+
+    # Pre-generated inspection times for each component
+    self._rng = rng if rng is not None else np.random.default_rng()
+    self._inspection_time_batch_size = [0] * COMPONENT_SLOTS
+    for component in components:
+      self._inspection_time_batch_size[component] = self.get_batch_size(self._component_means[component], INSPECTION_TIME_BATCH_SIZE)
+    # Each batch starts out used up, so it is only drawn once the run needs it
+    self._inspection_time_batch = [None] * COMPONENT_SLOTS
+    self._inspection_time_index = list(self._inspection_time_batch_size)
+
+    # Pre-generated component choices, sized for an inspector that always picks its quickest component
+    self._component_batch_size = self.get_batch_size(min(self._component_means[component] for component in components), COMPONENT_BATCH_SIZE)
+    self._component_batch = None
+    self._component_index = self._component_batch_size
+
+    # Debug messages are only formatted if debug logging was enabled when the inspector was set up
+    self._debug = logger.isEnabledFor(logging.DEBUG)
 
     # Stats for analysis
     self.start_recording = start_recording
@@ -23,90 +112,171 @@ class Inspector(object):
     self.current_component = None
     self.start = 0
     self.end = 0
-    self.wait_time = []
-    self.inspection_times = {component.name:list() for component in components}
-    self.total_amount_inspected = {component.name:0 for component in components}
+    # Only the first wait_time_count wait times, and the first total_amount_inspected
+    # inspection times for each component, are recorded values
+    # The per-component lists are indexed by the component itself, entries for components
+    # the inspector doesn't handle are unused
+    record_sizes = [0] * COMPONENT_SLOTS
+    for component in components:
+      if sim_duration is None:
+        record_sizes[component] = RECORD_SIZE
+      else:
+        # Size the arrays for the expected number of components inspected while recording
+        record_sizes[component] = max(1, int((sim_duration - start_recording) / self._component_means[component] * RECORD_MARGIN))
+    self.wait_time = np.empty(max(record_sizes), dtype=np.float64)
+    self.wait_time_count = 0
+    self.inspection_times = [None] * COMPONENT_SLOTS
+    for component in components:
+      self.inspection_times[component] = np.empty(record_sizes[component], dtype=np.float64)
+    self.total_amount_inspected = [0] * COMPONENT_SLOTS
+
+
+  def reset(self, env: Environment, rng: Optional[np.random.Generator]=None) -> None:
+    '''Reset the inspector so it can be reused in a new environment, keeping the allocated arrays'''
+    self.env = env
+    if rng is not None:
+      self._rng = rng
+    self._debug = logger.isEnabledFor(logging.DEBUG)
+    # Mark the random batches as used up, so new ones are drawn when the run needs them
+    self._inspection_time_index = list(self._inspection_time_batch_size)
+    self._component_index = self._component_batch_size
+
+    self.current_inspection_time = None
+    self.current_component = None
+    self.start = 0
+    self.end = 0
+    self.wait_time_count = 0
+    self.total_amount_inspected = [0] * COMPONENT_SLOTS
+
+
+  def generate_components(self) -> np.ndarray:
+    '''Generate a batch of random components for the inspector to inspect, as indices into its component list'''
+    if len(self.components) == 1:
+      # Nothing to choose from, so don't use any random numbers
+      return np.zeros(self._component_batch_size, dtype=np.intp)
+    return self._rng.integers(len(self.components), size=self._component_batch_size)
 
 
   def get_random_component(self) -> Component:
     '''Return a random component for the inspector to inspect'''
-    return random.choice(self.components)
+    index = self._component_index
+    if index == self._component_batch_size:
+      # Refill the batch once all of the components have been used
+      self._component_batch = self.generate_components()
+      index = 0
+    self._component_index = index + 1
+    return self.components[self._component_batch[index]]
+
+
+  def get_batch_size(self, mean: float, max_size: int) -> int:
+    '''Get the number of random values to generate at once for something that happens every mean minutes on average'''
+    if self.sim_duration is None:
+      return max_size
+    # Random values are used from the start of the run, not only once recording starts
+    return min(max_size, int(self.sim_duration / mean * BATCH_MARGIN) + BATCH_EXTRA)
+
+
+  def generate_inspection_times(self, component: Component) -> List[float]:
+    '''Generate a batch of inspection times for a specific component'''
+    return self._rng.exponential(scale=self._component_means[component], size=self._inspection_time_batch_size[component]).tolist()
 
 
   def get_inspection_time(self, component: Component) -> float:
     '''Get the inspection time for a specific component'''
-    return random.expovariate(1 / self.means[component.name])
+    index = self._inspection_time_index[component]
+    if index == self._inspection_time_batch_size[component]:
+      # Refill the batch once all of the inspection times have been used
+      self._inspection_time_batch[component] = self.generate_inspection_times(component)
+      index = 0
+    self._inspection_time_index[component] = index + 1
+    return self._inspection_time_batch[component][index]
   
   
-  def inspect_component(self) -> Generator:
-    '''Retrieve a new component and inspect it'''
-    # randomly select a component from within the list of inspectable components
-    component = self.get_random_component()
-    self.current_component = component
-
-    # Get inspection time
-    inspection_time = self.get_inspection_time(component)
-    self.current_inspection_time = inspection_time
-    
-    # inspect the component
-    yield self.env.timeout(inspection_time)
-    logging.debug('inspector {} inspected component {} at {}'.format(self.id, component.name, self.env.now))
-    return component # Return the component so it can be placed in the correct buffer
-
-
-  def add_component_to_buffer(self, component: Component) -> Generator:
-    '''Add the component to the correct buffer'''
-    # Routing policy for inspector 1
-    # Inspector 1 exclusively handles component 1
-    if component == Component.C1:
-      # Find the buffer with the least number of components
-      # So long as the inspector's buffer list is sorted by priority (highest first),
-      # this will always favor the highest priority buffer in case of a tie.
-      most_empty_buffer = self.buffers[0]
-      for buffer in self.buffers:
-        if buffer.level < most_empty_buffer.level:
-          most_empty_buffer = buffer
-      
-      # Test if all the buffers are full
-      if most_empty_buffer.level == most_empty_buffer.capacity:
-        # Wait until at least one buffer is ready
-        buffer_ready_events = [buffer.put(amount=1) for buffer in self.buffers]
-        self.start = self.env.now
-        result = yield self.env.any_of(buffer_ready_events)
-        self.end = self.env.now  
-        
-        logging.debug('result of wait for inspector is {}, time={}'.format(result, self.end - self.start))
-
-      # If buffer has space, add directly to that buffer
-      else:
-        self.start = self.env.now
-        yield most_empty_buffer.put(amount=1)
-        self.end = self.env.now
+  def route_least_full(self, component: Component) -> Generator:
+    '''
+    Routing policy for inspector 1
+    Inspector 1 exclusively handles component 1, and adds it to the buffer with the least components
+    '''
+    # Find the buffer with the least number of components
+    # So long as the inspector's buffer list is sorted by priority (highest first),
+    # this will always favor the highest priority buffer in case of a tie.
+    if len(self._buffer_tuple) == 3:
+      b0, b1, b2 = self._buffer_tuple
+      l0, l1, l2 = b0.level, b1.level, b2.level
+      most_empty_buffer = b0 if l0 <= l1 and l0 <= l2 else (b1 if l1 <= l2 else b2)
+    else:
+      # min returns the first of the least full buffers
+      most_empty_buffer = min(self._buffer_tuple, key=lambda buffer: buffer.level)
     
+    # Wait while all the buffers are full
+    self.start = self.env.now
+    while most_empty_buffer.level == most_empty_buffer.capacity:
+      # Wait until a component is taken from one of the buffers, then look again for the least full one
+      yield self.env.any_of([buffer.not_full_event for buffer in self._buffer_tuple])
+      most_empty_buffer = min(self._buffer_tuple, key=lambda buffer: buffer.level)
+      if self._debug:
+        logger.debug('inspector %s waited for a buffer, time=%s', self.id, self.env.now - self.start)
 
-    # Routing policy for inspector 2
-    # Inspector 2 exclusively handles components C2 and C3 (only)
-    else:
-      # Create list of buffers that will accept a component
-      buffer_list = list(filter(lambda x: (x.will_accept(component)), self.buffers))
-      if len(buffer_list) > 0:
-        self.start = self.env.now
-        yield buffer_list[0].put(amount=1)
-        self.end = self.env.now
-        logging.debug('inspector 2 put component {} in buffer {} at {}'.format(component.name, buffer_list[0].id, self.env.now))
+    # Add the component to the buffer with the most space
+    yield most_empty_buffer.put(amount=1)
+    self.end = self.env.now
+
+
+  def route_by_component(self, component: Component) -> Generator:
+    '''
+    Routing policy for inspector 2
+    Inspector 2 exclusively handles components C2 and C3 (only), and adds them to the buffer that accepts them
+    '''
+    # Get the buffer that will accept the component
+    buffer = self._accept_map[component]
+    if buffer is not None:
+      self.start = self.env.now
+      yield buffer.put(amount=1)
+      self.end = self.env.now
+      if self._debug:
+        logger.debug('inspector 2 put component %s in buffer %s at %s', component.name, buffer.id, self.env.now)
   
 
   def record_stats(self) -> None:
     '''Record stats about the inspector'''
-    self.total_amount_inspected[self.current_component.name] += 1
-    self.wait_time.append(self.end - self.start) # append buffer wait time
-    self.inspection_times[self.current_component.name].append(self.current_inspection_time)
+    # Double the size of the arrays once they are full
+    index = self.wait_time_count
+    if index == self.wait_time.size:
+      self.wait_time = np.resize(self.wait_time, index * 2)
+    self.wait_time[index] = self.end - self.start # record buffer wait time
+    self.wait_time_count = index + 1
+
+    component = self.current_component
+    index = self.total_amount_inspected[component]
+    inspection_times = self.inspection_times[component]
+    if index == inspection_times.size:
+      inspection_times = self.inspection_times[component] = np.resize(inspection_times, index * 2)
+    inspection_times[index] = self.current_inspection_time
+    self.total_amount_inspected[component] = index + 1
 
 
   def main_loop(self) -> None:
-    '''Main sequence loop for Inspector'''
+    '''
+    Main sequence loop for Inspector
+    Inspecting, routing and recording all happen in this one generator, so no extra
+    SimPy processes are created for each component
+    '''
+    env = self.env
+    route = self._route
+    debug = self._debug
     while True:
-      component = yield self.env.process(self.inspect_component())
-      yield self.env.process(self.add_component_to_buffer(component))
-      if (self.env.now >= self.start_recording):
+      # randomly select a component from within the list of inspectable components
+      component = self.get_random_component()
+      self.current_component = component
+      inspection_time = self.get_inspection_time(component)
+      self.current_inspection_time = inspection_time
+
+      # inspect the component
+      yield env.timeout(inspection_time)
+      if debug:
+        logger.debug('inspector %s inspected component %s at %s', self.id, component.name, env.now)
+
+      # Add the component to the correct buffer, using the routing policy chosen in __init__
+      yield from route(component)
+      if (env.now >= self.start_recording):
         self.record_stats()
@@ -1,77 +1,160 @@
 import logging
-import random
-from typing import Generator, List, Union
+from typing import List, Optional, Union
 
-import simpy
 from simpy import Environment
 
 import numpy
 
 from .buffer import Buffer
 
+logger = logging.getLogger(__name__)
+
+# Largest number of assembly times generated at once
+ASSEMBLY_TIME_BATCH_SIZE = 8192
+
+# Number of entries initially allocated for the recorded statistics if the simulation duration
+# is unknown, grows as needed
+RECORD_SIZE = 4096
+
+# Extra room allocated on top of the expected number of recorded entries
+RECORD_MARGIN = 1.5
+
+# Extra random values generated on top of the expected number used in a run, so a batch rarely
+# needs refilling. The fixed extra covers short runs, where few values are expected
+BATCH_MARGIN = 1.5
+BATCH_EXTRA = 16
+
 
 class Workstation(object):
-  def __init__(self, id: int, env: Environment, buffers: List[Buffer], mean: float, start_recording: Union[int, float]=0) -> None:
+  def __init__(self, id: int, env: Environment, buffers: List[Buffer], mean: float, start_recording: Union[int, float]=0, rng: Optional[numpy.random.Generator]=None, sim_duration: Optional[Union[int, float]]=None) -> None:
     super().__init__()
     self.id = id
     self.env = env
     self.buffers = buffers
     self.mean = mean
+    self.sim_duration = sim_duration
+    self._rng = rng if rng is not None else numpy.random.default_rng()
     self.start_recording = start_recording
+    # Debug messages are only formatted if debug logging was enabled when the workstation was set up
+    self._debug = logger.isEnabledFor(logging.DEBUG)
+
+    # Pre-generated assembly times
+    # The batch starts out used up, so it is only drawn once the run needs it
+    self._assembly_time_batch_size = self.get_batch_size(mean, ASSEMBLY_TIME_BATCH_SIZE)
+    self._assembly_time_batch = None
+    self._assembly_time_index = self._assembly_time_batch_size
 
     # Stats for analysis
+    # Only the first total_amount_assembled entries of each array are recorded values
+    if sim_duration is None:
+      record_size = RECORD_SIZE
+    else:
+      # Size the arrays for the expected number of products assembled while recording
+      record_size = max(1, int((sim_duration - start_recording) / mean * RECORD_MARGIN))
+    self.total_amount_assembled = 0
+    self.wait_time = numpy.empty(record_size, dtype=numpy.float64)
+    self.processing_time = numpy.empty(record_size, dtype=numpy.float64)
+    self.component_finish_times = numpy.empty(record_size, dtype=numpy.float64)
+    self.wait = 0
+    self.start = 0
+    self.end = 0
+
+
+  def reset(self, env: Environment, rng: Optional[numpy.random.Generator]=None) -> None:
+    '''Reset the workstation so it can be reused in a new environment, keeping the allocated arrays'''
+    self.env = env
+    if rng is not None:
+      self._rng = rng
+    self._debug = logger.isEnabledFor(logging.DEBUG)
+    # Mark the random batch as used up, so a new one is drawn when the run needs it
+    self._assembly_time_index = self._assembly_time_batch_size
+
     self.total_amount_assembled = 0
-    self.wait_time = []
-    self.processing_time = []
-    self.component_finish_times = []
     self.wait = 0
     self.start = 0
     self.end = 0
 
 
+  def get_batch_size(self, mean: float, max_size: int) -> int:
+    '''Get the number of random values to generate at once for something that happens every mean minutes on average'''
+    if self.sim_duration is None:
+      return max_size
+    # Random values are used from the start of the run, not only once recording starts
+    return min(max_size, int(self.sim_duration / mean * BATCH_MARGIN) + BATCH_EXTRA)
+
+
+  def generate_assembly_times(self) -> List[float]:
+    '''Generate a batch of assembly times'''
+    return self._rng.exponential(scale=self.mean, size=self._assembly_time_batch_size).tolist()
+
+
   def get_assembly_time(self) -> float:
     '''Get the assembly time for a component'''
-    return random.expovariate(1 / self.mean)
+    index = self._assembly_time_index
+    if index == self._assembly_time_batch_size:
+      # Refill the batch once all of the assembly times have been used
+      self._assembly_time_batch = self.generate_assembly_times()
+      index = 0
+    self._assembly_time_index = index + 1
+    return self._assembly_time_batch[index]
 
 
-  def get_components(self) -> Generator:
-    '''Wait for all buffers to have at least one component ready for production'''
-    if not self.buffers:
-      raise RuntimeError('Workstation has no component buffers')
-    
-    logging.debug('workstation {} finished assembly at {}'.format(self.id, self.env.now))
-    self.wait = self.env.now
-    component_ready_events = [buffer.get(amount=1) for buffer in self.buffers]
-    yield self.env.all_of(component_ready_events)
-
-  
-  def assemble(self) -> Generator:
-    '''Assemble a product from components.'''
-    logging.debug('workstation {} starting assembly at {}'.format(self.id, self.env.now))
-    self.start = self.env.now
-    yield self.env.timeout(self.get_assembly_time())
-    self.end = self.env.now
-    
-    logging.debug('workstation {} finished assembly at {}'.format(self.id, self.env.now))
-  
-
   def record_stats(self) -> None:
     '''Record stats in data'''
-    self.total_amount_assembled += 1
-    self.wait_time.append(-self.wait+self.start)
-    self.processing_time.append(self.end-self.start)
-    self.component_finish_times.append(self.end)
+    index = self.total_amount_assembled
+    if index == self.wait_time.size:
+      # Double the size of the arrays once they are full
+      self.wait_time = numpy.resize(self.wait_time, index * 2)
+      self.processing_time = numpy.resize(self.processing_time, index * 2)
+      self.component_finish_times = numpy.resize(self.component_finish_times, index * 2)
+
+    self.wait_time[index] = -self.wait+self.start
+    self.processing_time[index] = self.end-self.start
+    self.component_finish_times[index] = self.end
+    self.total_amount_assembled = index + 1
 
 
   def main_loop(self) -> None:
-    '''Main sequence loop for Workstation.'''
+    '''
+    Main sequence loop for Workstation.
+    Waiting for components, assembling and recording all happen in this one generator,
+    so no extra SimPy processes are created for each product
+    '''
+    if not self.buffers:
+      raise RuntimeError('Workstation has no component buffers')
+
+    env = self.env
+    buffers = self.buffers
+    debug = self._debug
+    # Buffers that were empty when the workstation started waiting for components
+    empty = []
     while True:
-      yield self.env.process(self.get_components())
-      yield self.env.process(self.assemble())
-      if (self.env.now >= self.start_recording):
+      # Wait for all buffers to have at least one component ready for production
+      # Components are taken as soon as they are available, waiting on a buffer only while it is empty
+      self.wait = env.now
+      for buffer in buffers:
+        if buffer.level:
+          buffer.take(1)
+        else:
+          empty.append(buffer)
+      while empty:
+        # Wake up as soon as any of the empty buffers gets a component
+        if len(empty) == 1:
+          yield empty[0].not_empty_event
+        else:
+          yield env.any_of([buffer.not_empty_event for buffer in empty])
+        for buffer in [buffer for buffer in empty if buffer.level]:
+          buffer.take(1)
+          empty.remove(buffer)
+
+      # Assemble a product from the components
+      if debug:
+        logger.debug('workstation %s starting assembly at %s', self.id, env.now)
+      self.start = env.now
+      yield env.timeout(self.get_assembly_time())
+      self.end = env.now
+      if debug:
+        logger.debug('workstation %s finished assembly at %s', self.id, env.now)
+
+      if (env.now >= self.start_recording):
         self.record_stats()
-      
-
-    
-
-
@@ -1,14 +1,285 @@
 # Calculate statistics for each run of the simulation
 import logging
-from typing import List, Union
+from typing import List, NamedTuple, Union
 
 import numpy as np
-from numpy.core.fromnumeric import shape, var
+from numba import njit
 import pandas as pd
 
 from models import Inspector, Workstation
 
-def calc_stats_workstation(workstation_list: List[Workstation], iteration: int, sim_duration: Union[int, float], start_recording: Union[int, float]=0) -> np.ndarray:
+logger = logging.getLogger(__name__)
+
+# Names and types of the statistics columns calculated for each workstation and for each component of each inspector
+WORKSTATION_STATS_DTYPE = np.dtype([
+  ('iteration', np.int64), ('workstation_id', np.int64), ('processing_time_mean', np.float64),
+  ('processing_time_variance', np.float64), ('throughput', np.int64), ('total_idle_time', np.float64),
+  ('utilization', np.float64), ('average_idle_length', np.float64)
+])
+INSPECTOR_STATS_DTYPE = np.dtype([
+  ('iteration', np.int64), ('inspector_id', np.int64), ('component_id', np.int64),
+  ('component_inspection_time_mean', np.float64), ('component_inspection_time_variance', np.float64),
+  ('component_throughput', np.int64), ('total_idle_time', np.float64), ('utilization', np.float64),
+  ('average_idle_length', np.float64)
+])
+
+
+class WorkstationData(NamedTuple):
+  '''Data recorded by all workstations for a single simulation iteration, one entry per workstation'''
+  ids: np.ndarray
+  amounts_assembled: np.ndarray
+  # Start time of the last assembly
+  starts: np.ndarray
+  processing_times: List[np.ndarray]
+  wait_times: List[np.ndarray]
+
+
+class InspectorData(NamedTuple):
+  '''
+  Data recorded by all inspectors for a single simulation iteration, with one entry per inspector
+  followed by one entry per component of each inspector
+  '''
+  ids: np.ndarray
+  # Start time of the last buffer wait
+  starts: np.ndarray
+  num_components: np.ndarray
+  wait_times: List[np.ndarray]
+  component_ids: np.ndarray
+  amounts_inspected: np.ndarray
+  inspection_times: List[np.ndarray]
+
+
+def get_workstation_data(workstation_list: List[Workstation]) -> WorkstationData:
+  '''
+  Get a copy of the data recorded by all workstations for a single simulation iteration as plain arrays,
+  so the workstations can be reset and reused
+  ...
+  Parameters
+  ----------
+  workstation_list: List[Workstation]
+    List of all workstation models used for the current simulation run
+
+  Returns
+  ----------
+  WorkstationData:
+    The workstation ids, amounts assembled and last assembly start times, followed by
+    a list of the processing times and a list of the wait times of each workstation
+  '''
+  return WorkstationData(
+    ids=np.array([workstation.id for workstation in workstation_list]),
+    amounts_assembled=np.array([workstation.total_amount_assembled for workstation in workstation_list]),
+    starts=np.array([workstation.start for workstation in workstation_list], dtype=np.float64),
+    processing_times=[workstation.processing_time[:workstation.total_amount_assembled].copy() for workstation in workstation_list],
+    wait_times=[workstation.wait_time[:workstation.total_amount_assembled].copy() for workstation in workstation_list]
+  )
+
+
+def get_inspector_data(inspector_list: List[Inspector]) -> InspectorData:
+  '''
+  Get a copy of the data recorded by all inspectors for a single simulation iteration as plain arrays,
+  so the inspectors can be reset and reused
+  ...
+  Parameters
+  ----------
+  inspector_list: List[Inspectors]
+    List of all inspector models used for the current simulation run
+
+  Returns
+  ----------
+  InspectorData:
+    The inspector ids, last buffer wait start times, number of components and a list of
+    the wait times of each inspector, followed by the component ids, amounts inspected
+    and a list of the inspection times for each component of each inspector
+  '''
+  # Look up the recorded values of each component of each inspector once
+  components = [
+    (component.value, inspector.total_amount_inspected[component], inspector.inspection_times[component])
+    for inspector in inspector_list for component in inspector.components
+  ]
+  return InspectorData(
+    ids=np.array([inspector.id for inspector in inspector_list]),
+    starts=np.array([inspector.start for inspector in inspector_list], dtype=np.float64),
+    num_components=np.array([len(inspector.components) for inspector in inspector_list]),
+    wait_times=[inspector.wait_time[:inspector.wait_time_count].copy() for inspector in inspector_list],
+    component_ids=np.array([value for value, _, _ in components]),
+    amounts_inspected=np.array([count for _, count, _ in components]),
+    inspection_times=[inspection_times[:count].copy() for _, count, inspection_times in components]
+  )
+
+
+@njit(cache=True)
+def _group_reduce(values: np.ndarray, offsets: np.ndarray) -> tuple:
+  '''
+  Calculate the mean, variance, total and number of non-zero values of each group in a single pass
+  ...
+  Parameters
+  ----------
+  values: np.ndarray
+    Values of all groups, one group after the other
+  offsets: np.ndarray
+    Start of each group in values, followed by the end of the last group
+
+  Returns
+  ----------
+  tuple:
+    The mean and variance of each group (nan for empty groups), followed by the total
+    and the number of non-zero values of each group
+  '''
+  num_groups = offsets.shape[0] - 1
+  mean = np.full(num_groups, np.nan)
+  variance = np.full(num_groups, np.nan)
+  total = np.zeros(num_groups)
+  nonzero = np.zeros(num_groups, dtype=np.int64)
+  for group in range(num_groups):
+    # Welford's algorithm for the mean and variance
+    count = 0
+    group_mean = 0.0
+    squares = 0.0
+    group_total = 0.0
+    group_nonzero = 0
+    for index in range(offsets[group], offsets[group + 1]):
+      value = values[index]
+      count += 1
+      delta = value - group_mean
+      group_mean += delta / count
+      squares += delta * (value - group_mean)
+      group_total += value
+      if value != 0:
+        group_nonzero += 1
+    if count > 0:
+      mean[group] = group_mean
+      variance[group] = squares / count
+    total[group] = group_total
+    nonzero[group] = group_nonzero
+  return mean, variance, total, nonzero
+
+
+def group_reduce(groups: List[np.ndarray]) -> tuple:
+  '''Calculate the mean, variance, total and number of non-zero values of each array in a list at once'''
+  offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+  np.cumsum([len(group) for group in groups], out=offsets[1:])
+  values = np.concatenate(groups).astype(np.float64, copy=False) if groups else np.empty(0)
+  return _group_reduce(values, offsets)
+
+
+def group_mean_var(groups: List[np.ndarray]) -> tuple:
+  '''Calculate the mean and variance of each array in a list at once, with nan for empty arrays'''
+  mean, variance, _, _ = group_reduce(groups)
+  return mean, variance
+
+
+def group_idle(groups: List[np.ndarray]) -> tuple:
+  '''Calculate the total and the average non-zero wait time of each array in a list at once'''
+  _, _, total, nonzero = group_reduce(groups)
+  # Zero wait times are not idle periods, so they are left out of the average
+  with np.errstate(divide='ignore', invalid='ignore'):
+    average = total / nonzero
+  return total, average
+
+
+def calc_stats_workstation_batch(run_data: list, sim_duration: Union[int, float], start_recording: Union[int, float]=0, first_iteration: int=0) -> dict:
+  '''
+  Calculate statistics for all workstations for all simulation iterations at once.
+  ...
+  Parameters
+  ----------
+  run_data: list
+    The data from get_workstation_data for each iteration of the simulation
+  sim_duration: Union[int, float]
+    Amount of minutes in the simulation run
+  start_recording: Union[int, float]
+    Time at which the workstations started recording statistics
+  first_iteration: int
+    Iteration number of the first entry in run_data
+
+  Returns
+  ----------
+  dict:
+    One array per column named and typed by WORKSTATION_STATS_DTYPE, with an entry for each workstation in each iteration
+  '''
+  iteration = np.repeat(np.arange(first_iteration, first_iteration + len(run_data)), [len(data.ids) for data in run_data])
+  workstation_id = np.concatenate([data.ids for data in run_data])
+  throughput = np.concatenate([data.amounts_assembled for data in run_data])
+  start = np.concatenate([data.starts for data in run_data])
+
+  # Calculate mean and variance of workstation processing time
+  mean, variance = group_mean_var([processing_time for data in run_data for processing_time in data.processing_times])
+
+  # Calculate total idle time and average idle length
+  total_idle_time, average_idle_length = group_idle([wait_time for data in run_data for wait_time in data.wait_times])
+
+  # Calculate utilization
+  recording_duration = sim_duration - start_recording
+  utilization = (recording_duration - total_idle_time) / recording_duration
+
+  # If nothing was assembled by the workstation, it has been idle since its last assembly started
+  nothing_assembled = throughput == 0
+  for index in np.flatnonzero(nothing_assembled & (start != 0)):
+    logger.debug('Iteration %s: ws%s started assembly but did not finish', iteration[index], workstation_id[index])
+  total_idle_time = np.where(nothing_assembled, recording_duration - start, total_idle_time)
+  utilization = np.where(nothing_assembled, 0, utilization) #?? fix this later???
+  average_idle_length = np.where(nothing_assembled, recording_duration - start, average_idle_length)
+
+  # Keep each column as its own contiguous array, so the dataframe can use them without copying
+  columns = (iteration, workstation_id, mean, variance, throughput, total_idle_time, utilization, average_idle_length)
+  return {
+    name:np.asarray(values, dtype=WORKSTATION_STATS_DTYPE[name])
+    for name, values in zip(WORKSTATION_STATS_DTYPE.names, columns)
+  }
+
+
+def calc_stats_inspector_batch(run_data: list, sim_duration: Union[int, float], start_recording: Union[int, float]=0, first_iteration: int=0) -> dict:
+  '''
+  Calculate statistics for all inspectors for all simulation iterations at once.
+  ...
+  Parameters
+  ----------
+  run_data: list
+    The data from get_inspector_data for each iteration of the simulation
+  sim_duration: Union[int, float]
+    Amount of minutes in the simulation run
+  start_recording: Union[int, float]
+    Time at which the inspectors started recording statistics
+  first_iteration: int
+    Iteration number of the first entry in run_data
+
+  Returns
+  ----------
+  dict:
+    One array per column named and typed by INSPECTOR_STATS_DTYPE, with an entry for each component of each inspector in each iteration
+  '''
+  # Number of components of each inspector, used to repeat the inspector values for each component
+  num_components = np.concatenate([data.num_components for data in run_data])
+  iteration = np.repeat(np.arange(first_iteration, first_iteration + len(run_data)), [len(data.component_ids) for data in run_data])
+  inspector_id = np.repeat(np.concatenate([data.ids for data in run_data]), num_components)
+  start = np.repeat(np.concatenate([data.starts for data in run_data]), num_components)
+  component_id = np.concatenate([data.component_ids for data in run_data])
+  throughput = np.concatenate([data.amounts_inspected for data in run_data])
+
+  # Calculate common values for all components
+  # Calculate total idle time and average idle length, nan if the inspector was never idle
+  total_idle_time, average_idle_length = group_idle([wait_time for data in run_data for wait_time in data.wait_times])
+  total_idle_time = np.repeat(total_idle_time, num_components)
+  average_idle_length = np.repeat(average_idle_length, num_components)
+
+  # Calculate utilization
+  utilization = ((sim_duration - start_recording) - total_idle_time) / (sim_duration - start_recording)
+
+  # Calculate mean and variance of inspector processing time for each component
+  mean, variance = group_mean_var([inspection_times for data in run_data for inspection_times in data.inspection_times])
+
+  for index in np.flatnonzero((throughput == 0) & (start != 0)):
+    logger.debug('Iteration %s: insp%s started inspection for component %s but did not finish', iteration[index], inspector_id[index], component_id[index])
+
+  # Keep each column as its own contiguous array, so the dataframe can use them without copying
+  columns = (iteration, inspector_id, component_id, mean, variance, throughput, total_idle_time, utilization, average_idle_length)
+  return {
+    name:np.asarray(values, dtype=INSPECTOR_STATS_DTYPE[name])
+    for name, values in zip(INSPECTOR_STATS_DTYPE.names, columns)
+  }
+
+
+def calc_stats_workstation(workstation_list: List[Workstation], iteration: int, sim_duration: Union[int, float], start_recording: Union[int, float]=0) -> dict:
   '''
   Calculate statistics for all workstations for a single simulation iteration. 
   ...
@@ -23,64 +294,18 @@ def calc_stats_workstation(workstation_list: List[Workstation], iteration: int,
   
   Returns
   ----------
-  numpy.array:
-    A 2d numpy array with each row as the statistics for one of the workstations
-  '''
-  workstation_array = np.empty(shape=(len(workstation_list),), dtype=object)
-
-  # Calculate statistics for workstations
-  for index, workstation in enumerate(workstation_list):
-
-    # TODO: check for case if has started assembly but has not finished?
-    # Check if workstation has assembled anything
-    if (workstation.total_amount_assembled == 0):
-      if workstation.start != 0:
-        logging.debug('Iteration {}: ws{} started assembly but did not finish'.format(iteration, workstation.id))
-      # If nothing was assembled by the workstation, set specific values
-      mean = np.nan,
-      variance = np.nan,
-      throughput = 0 # Fractional if not complete at end of iteration??
-      total_idle_time = (sim_duration - start_recording) - workstation.start
-      utilization = 0 #?? fix this later???
-      average_idle_length = (sim_duration - start_recording) - workstation.start
-
-    else:
-      # Calculate mean and variance of workstation processing time
-      processing_time = np.asarray(workstation.processing_time)
-      mean = processing_time.mean()
-      variance = processing_time.var()
-
-      # Calculate overall throughput
-      throughput = workstation.total_amount_assembled
-
-      # Calculate total idle time
-      wait_time = np.asarray(workstation.wait_time)
-      total_idle_time = wait_time.sum()
-
-      # Calculate utilization
-      utilization = ((sim_duration - start_recording)  - total_idle_time) / (sim_duration - start_recording)
-
-      # Calculate average idle length
-      wait_time[wait_time == 0] = np.nan  # Set all zero values to nan 
-      average_idle_length = np.nanmean(wait_time)
-
-    workstation_series = pd.Series({
-      'iteration': iteration,
-      'workstation_id': workstation.id,
-      'processing_time_mean': mean,
-      'processing_time_variance': variance,
-      'throughput': throughput,
-      'total_idle_time': total_idle_time,
-      'utilization': utilization,
-      'average_idle_length': average_idle_length
-    })
-
-    workstation_array[index] = workstation_series.to_numpy()
-    
-  return np.stack(workstation_array)
-
-
-def calc_stats_inspector(inspector_list: List[Inspector], iteration: int, sim_duration: Union[int, float], start_recording: Union[int, float]=0):
+  dict:
+    One array per column named and typed by WORKSTATION_STATS_DTYPE, with an entry for each of the workstations
+  '''
+  return calc_stats_workstation_batch(
+    run_data=[get_workstation_data(workstation_list)],
+    sim_duration=sim_duration,
+    start_recording=start_recording,
+    first_iteration=iteration
+  )
+
+
+def calc_stats_inspector(inspector_list: List[Inspector], iteration: int, sim_duration: Union[int, float], start_recording: Union[int, float]=0) -> dict:
   '''
   Calculate statistics for all inspectors for a single simulation iteration. 
   ...
@@ -95,118 +320,46 @@ def calc_stats_inspector(inspector_list: List[Inspector], iteration: int, sim_du
   
   Returns
   ----------
-  numpy.array:
-    A 2d numpy array with each row as the statistics for one of the inspectors
-  '''
-  # Get the total number of rows for the array
-  total_entries = sum(len(inspector.components) for inspector in inspector_list)
-
-  inspector_array = np.empty(shape=(total_entries,), dtype=object)
-
-  current_index = 0
-  # Calculate statistics for inspectors
-  for inspector in inspector_list:
-
-    # Calculate common values for all components
-    # Calculate total idle time
-    wait_time = np.asarray(inspector.wait_time)
-    total_idle_time = wait_time.sum()
-
-    
-    # Calculate utilization
-    utilization = ((sim_duration - start_recording) - total_idle_time) / (sim_duration - start_recording)
-    
-
-    # Calculate average idle length
-    if (np.any(wait_time != 0.0)):
-      wait_time[wait_time == 0] = np.nan  # Set all zero values to nan 
-      average_idle_length = np.nanmean(wait_time)
-    else:
-      # If all wait times in array are zero, then machine was never idle. 
-      average_idle_length = np.nan
-
-
-    # Calculate statistics for each individual component for each inspector
-    for component in inspector.components:
-      # Check if inspector has inspected anything
-      if (inspector.total_amount_inspected[component.name] == 0):
-        if inspector.start != 0:
-          logging.debug('Iteration {}: insp{} started inspection for component {} but did not finish'.format(iteration, inspector.id, component.name))
-        # If nothing was inspected, set specific values
-        mean = np.nan,
-        variance = np.nan,
-        throughput = 0 # Fractional if not complete at end of iteration?
-
-      else:
-        # Calculate mean and variance of inspector processing time
-        processing_time = np.asarray(inspector.inspection_times[component.name])
-        mean = processing_time.mean()
-        variance = processing_time.var()
-
-        # Calculate overall throughput for specific component
-        throughput = inspector.total_amount_inspected[component.name]
-
-      # Create series for this inspector and this component
-      inspector_series = pd.Series({
-        'iteration': iteration,
-        'inspector_id': inspector.id,
-        'component_id': component.value,
-        'component_inspection_time_mean': pd.to_numeric(mean, errors='coerce'),
-        'component_inspection_time_variance': pd.to_numeric(variance, errors='coerce'),
-        'component_throughput': throughput,
-        'total_idle_time': total_idle_time,
-        'utilization': utilization,
-        'average_idle_length': average_idle_length
-      }, dtype='float')
-
-      # Save series to be returned
-      inspector_array[current_index] = inspector_series.to_numpy()
-      current_index += 1
-    
-  return np.stack(inspector_array)
-
-
-def create_df_workstations(run_data: np.ndarray) -> pd.DataFrame:
+  dict:
+    One array per column named and typed by INSPECTOR_STATS_DTYPE, with an entry for each of the inspectors
+  '''
+  return calc_stats_inspector_batch(
+    run_data=[get_inspector_data(inspector_list)],
+    sim_duration=sim_duration,
+    start_recording=start_recording,
+    first_iteration=iteration
+  )
+
+
+def create_df_workstations(run_data: Union[dict, List[dict]]) -> pd.DataFrame:
   '''
   Create a dataframe to store all workstation stats for each simulation iteration 
   '''
-  # Flatten array into pandas dataframe
-  df = pd.DataFrame(
-    data=np.vstack(run_data), 
-    columns=['iteration', 'workstation_id', 'processing_time_mean', 
-             'processing_time_variance', 'throughput', 'total_idle_time', 
-             'utilization', 'average_idle_length']
-  )
+  # Join the columns of per-iteration stats only if a list of them was given
+  if isinstance(run_data, list):
+    run_data = {name:np.concatenate([data[name] for data in run_data]) for name in WORKSTATION_STATS_DTYPE.names}
 
-  # Convert (nan,) tuple to just NaN
-  df['processing_time_mean'] = pd.to_numeric(df['processing_time_mean'], errors='coerce')
-  df['processing_time_variance'] = pd.to_numeric(df['processing_time_variance'], errors='coerce')
+  # Build the pandas dataframe from the column arrays without copying them
+  df = pd.DataFrame(data=run_data, copy=False)
 
   return df
 
 
-def create_df_inspectors(run_data: np.ndarray) -> pd.DataFrame:
+def create_df_inspectors(run_data: Union[dict, List[dict]]) -> pd.DataFrame:
   '''
   Create a dataframe to store all inspector stats for each simulation iteration
 
   Args:
-    run_data: array of all data produced in calc_stats_inspector
+    run_data: columns of all data produced in calc_stats_inspector
   
   Returns:
     df: Dataframe containing all data from all iterations
   '''
-  # Flatten array into pandas dataframe
-  df = pd.DataFrame(
-    data=np.vstack(run_data), 
-    columns=['iteration', 'inspector_id', 'component_id',
-        'component_inspection_time_mean', 'component_inspection_time_variance',
-        'component_throughput', 'total_idle_time', 'utilization', 'average_idle_length'],
-    dtype='float'
-  )
+  # Join the columns of per-iteration stats only if a list of them was given
+  if isinstance(run_data, list):
+    run_data = {name:np.concatenate([data[name] for data in run_data]) for name in INSPECTOR_STATS_DTYPE.names}
 
-  # Convert (nan,) tuple to just NaN
-  # df['processing_time_mean'] = pd.to_numeric(df['processing_time_mean'], errors='coerce')
-  # df['processing_time_variance'] = pd.to_numeric(df['processing_time_variance'], errors='coerce')
-
-  return df.astype('float')
+  # Build the pandas dataframe from the column arrays without copying them
+  df = pd.DataFrame(data=run_data, copy=False)
 
+  return df
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The simulation modules import each other relative to src, like when running src/main.py
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
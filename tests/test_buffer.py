@@ -0,0 +1,68 @@
+import simpy
+
+from models import Buffer, Component
+
+
+def test_take_wakes_waiters_when_no_longer_full():
+  env = simpy.Environment()
+  buffer = Buffer('b', env, Component.C1, capacity=1, init=1)
+  not_full_event = buffer.not_full_event
+  queued_put = buffer.put(1)
+  assert not queued_put.triggered
+
+  buffer.take(1)
+
+  # The freed space wakes anything waiting on the buffer, and is taken by the queued put
+  assert not_full_event.triggered
+  assert buffer.not_full_event is not not_full_event
+  assert queued_put.triggered
+  assert buffer.level == 1
+
+
+def test_put_into_empty_buffer_triggers_not_empty():
+  env = simpy.Environment()
+  buffer = Buffer('b', env, Component.C1, capacity=2)
+  not_empty_event = buffer.not_empty_event
+
+  buffer.put(1)
+  assert not_empty_event.triggered
+  next_event = buffer.not_empty_event
+
+  # Only the change from empty triggers the event
+  buffer.put(1)
+  assert not next_event.triggered
+  assert buffer.level == 2
+
+
+def test_get_from_full_buffer_triggers_not_full():
+  env = simpy.Environment()
+  buffer = Buffer('b', env, Component.C1, capacity=1, init=1)
+  not_full_event = buffer.not_full_event
+
+  buffer.get(1)
+
+  # The freed space wakes anything waiting on the buffer, and the event is replaced for the next wait
+  assert not_full_event.triggered
+  assert buffer.not_full_event is not not_full_event
+  assert buffer.level == 0
+
+
+def test_get_from_buffer_with_space_does_not_trigger_not_full():
+  env = simpy.Environment()
+  buffer = Buffer('b', env, Component.C1, capacity=2, init=1)
+  not_full_event = buffer.not_full_event
+
+  buffer.get(1)
+  assert not not_full_event.triggered
+  assert buffer.not_full_event is not_full_event
+
+
+def test_reset_empties_buffer_and_renews_events():
+  env = simpy.Environment()
+  buffer = Buffer('b', env, Component.C1, capacity=2, init=2)
+
+  new_env = simpy.Environment()
+  buffer.reset(new_env)
+  assert buffer.level == 0
+  assert buffer.not_full_event.env is new_env
+  assert buffer.not_empty_event.env is new_env
@@ -0,0 +1,16 @@
+import pytest
+
+import main
+
+
+def test_read_file_mean(tmp_path):
+  path = tmp_path / 'values.dat'
+  path.write_text('1.0\n\n2.0\n6.0\n')
+  assert main.read_file_mean(str(path)) == pytest.approx(3.0)
+
+
+def test_read_file_mean_of_blank_file_names_the_file(tmp_path):
+  path = tmp_path / 'blank.dat'
+  path.write_text('\n  \n')
+  with pytest.raises(ValueError, match='blank.dat'):
+    main.read_file_mean(str(path))
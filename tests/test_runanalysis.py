@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import runanalysis
+
+
+@pytest.fixture
+def groups():
+  '''Groups of wait-time-like values with zeros, including empty groups and a single value'''
+  rng = np.random.default_rng(0)
+  sizes = [0, 1, 5, 1000, 0, 3]
+  return [rng.exponential(size=size) * (rng.random(size) > 0.3) for size in sizes]
+
+
+def test_group_reduce_matches_numpy(groups):
+  mean, variance, total, nonzero = runanalysis.group_reduce(groups)
+
+  for index, group in enumerate(groups):
+    if len(group) == 0:
+      assert np.isnan(mean[index])
+      assert np.isnan(variance[index])
+      assert total[index] == 0
+      assert nonzero[index] == 0
+    else:
+      assert mean[index] == pytest.approx(np.mean(group))
+      assert variance[index] == pytest.approx(np.var(group))
+      assert total[index] == pytest.approx(np.sum(group))
+      assert nonzero[index] == np.count_nonzero(group)
+
+
+def test_group_reduce_no_groups():
+  mean, variance, total, nonzero = runanalysis.group_reduce([])
+  assert len(mean) == len(variance) == len(total) == len(nonzero) == 0
+
+
+def test_group_idle_skips_zero_waits(groups):
+  total, average = runanalysis.group_idle(groups)
+
+  for index, group in enumerate(groups):
+    assert total[index] == pytest.approx(np.sum(group))
+    if np.count_nonzero(group):
+      assert average[index] == pytest.approx(np.mean(group[group != 0]))
+    else:
+      assert np.isnan(average[index])
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import main
+
+SEEDS = range(100)
+SIM_TIME = 5000
+START_RECORDING = 0
+
+
+@pytest.fixture
+def means(monkeypatch, tmp_path):
+  '''Means from the data files, with the simulation settings normally parsed from the command line'''
+  monkeypatch.chdir(main.os.path.dirname(main.os.path.dirname(main.os.path.abspath(main.__file__))))
+  # Keep the means cache out of the working tree, and don't reuse means read by another test
+  monkeypatch.setattr(main, 'MEANS_CACHE', str(tmp_path / 'means_cache.npz'))
+  main.read_means.cache_clear()
+  monkeypatch.setattr(main, 'SIM_TIME', SIM_TIME, raising=False)
+  monkeypatch.setattr(main, 'START_RECORDING', START_RECORDING, raising=False)
+  yield main.init_means()
+  main.read_means.cache_clear()
+
+
+def run_seeds(monkeypatch, means: dict, fast: bool) -> tuple:
+  '''Run every seed and get the amounts assembled, amounts inspected and mean processing times of each run'''
+  monkeypatch.setattr(main, 'FAST', fast, raising=False)
+  models = None if fast else main.build_models(means)
+  assembled, inspected, processing = [], [], []
+  for seed in SEEDS:
+    workstation_data, inspector_data = main.run_iteration(seed, means, models)
+    assembled.append(workstation_data.amounts_assembled)
+    inspected.append(inspector_data.amounts_inspected)
+    processing.append([times.mean() for times in workstation_data.processing_times])
+  return np.array(assembled, dtype=np.float64), np.array(inspected, dtype=np.float64), np.array(processing)
+
+
+def assert_same_distribution(simpy_values: np.ndarray, fast_values: np.ndarray) -> None:
+  '''Check that the means of each column agree within 4 standard errors of their difference'''
+  standard_error = np.sqrt(
+    simpy_values.var(axis=0, ddof=1) / len(simpy_values) + fast_values.var(axis=0, ddof=1) / len(fast_values)
+  )
+  difference = np.abs(simpy_values.mean(axis=0) - fast_values.mean(axis=0))
+  assert np.all(difference <= 4 * standard_error + 1e-9), (simpy_values.mean(axis=0), fast_values.mean(axis=0))
+
+
+def test_fast_simulation_matches_simpy(monkeypatch, means):
+  simpy_assembled, simpy_inspected, simpy_processing = run_seeds(monkeypatch, means, fast=False)
+  fast_assembled, fast_inspected, fast_processing = run_seeds(monkeypatch, means, fast=True)
+
+  # Both simulations produce something, and the same layout of results
+  assert simpy_assembled.shape == fast_assembled.shape
+  assert simpy_inspected.shape == fast_inspected.shape
+  assert np.all(simpy_assembled > 0) and np.all(fast_assembled > 0)
+
+  assert_same_distribution(simpy_assembled, fast_assembled)
+  assert_same_distribution(simpy_inspected, fast_inspected)
+  assert_same_distribution(simpy_processing, fast_processing)
+
+
+def test_fast_simulation_is_reproducible(monkeypatch, means):
+  monkeypatch.setattr(main, 'FAST', True, raising=False)
+  first = main.run_iteration(7, means, None)
+  second = main.run_iteration(7, means, None)
+  np.testing.assert_array_equal(first[0].amounts_assembled, second[0].amounts_assembled)
+  np.testing.assert_array_equal(first[1].amounts_inspected, second[1].amounts_inspected)